@@ -1,22 +1,45 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, render_template, jsonify, Response, stream_with_context
+from flask_caching import Cache
 import os
 import sys
+import io
 import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 import uuid
 import logging
+import functools
 from pathlib import Path
 from werkzeug.utils import secure_filename
 import json
+import orjson
 
 # Initialize Flask app
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit file size to 16MB
 app.config['ALLOWED_EXTENSIONS'] = {'pdf'}
 
-# Create upload folder if it doesn't exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Cache for KB metadata so polling clients don't hit Bedrock on every request
+cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+
+# Transfer config for streaming uploads straight to S3's multipart uploader.
+# 8MB parts on parallel connections: files at the 16MB cap split into two
+# parts uploaded concurrently instead of one single-stream PUT.
+MB = 1024 * 1024
+s3_transfer_config = TransferConfig(
+    multipart_threshold=8 * MB,
+    multipart_chunksize=8 * MB,
+    max_concurrency=8,
+    use_threads=True
+)
+
+# The multipart form endpoint buffers the file before handing it to the
+# upload workers, so it keeps a size cap; arbitrarily large PDFs go through
+# the streaming PUT endpoint instead
+MAX_FORM_UPLOAD_BYTES = 16 * MB
 
 # Set up logging
 logging.basicConfig(
@@ -25,22 +48,72 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize AWS clients
+# Initialize AWS clients. One client per service, shared across requests,
+# with a pool large enough for concurrent handlers and keepalive so TLS
+# sessions get reused instead of re-handshaking under load.
+boto_config = Config(
+    max_pool_connections=64,
+    retries={'mode': 'adaptive', 'max_attempts': 5},
+    tcp_keepalive=True
+)
 session = boto3.session.Session()
 region = session.region_name
-s3_client = boto3.client('s3')
-sts_client = boto3.client('sts')
-bedrock_agent_client = boto3.client('bedrock-agent')
-bedrock_agent_runtime_client = boto3.client('bedrock-agent-runtime')
-account_id = sts_client.get_caller_identity()["Account"]
-
-# KB settings
-timestamp_str = time.strftime("%Y%m%d%H%M%S", time.localtime(time.time()))[-7:]
-suffix = f"{timestamp_str}"
+s3_client = boto3.client('s3', config=boto_config)
+sts_client = boto3.client('sts', config=boto_config)
+iam_client = boto3.client('iam', config=boto_config)
+bedrock_agent_client = boto3.client('bedrock-agent', config=boto_config)
+bedrock_agent_runtime_client = boto3.client('bedrock-agent-runtime', config=boto_config)
+
+# Resolve the account id lazily so importing the module doesn't block on an
+# STS round-trip (or fail outright without credentials)
+@functools.lru_cache(maxsize=1)
+def get_account_id():
+    return os.environ.get("AWS_ACCOUNT_ID") or sts_client.get_caller_identity()["Account"]
+
+# KB settings. The suffix must be identical across pre-forked workers (a
+# timestamp fragment can differ between worker imports), so it comes from the
+# environment; operators set KB_SUFFIX to pin a deployment to one KB.
+suffix = os.environ.setdefault("KB_SUFFIX", uuid.uuid4().hex[:7])
 knowledge_base_name = f"bedrock-flask-kb-{suffix}"
-data_bucket_name = f'bedrock-kb-data-{suffix}-{account_id}'
 foundation_model = "anthropic.claude-3-sonnet-20240229-v1:0"
 
+# Model ARNs are static per process, so build them once instead of
+# formatting f-strings on every call
+TITAN_EMBED_MODEL_ARN = f"arn:aws:bedrock:{region}::foundation-model/amazon.titan-embed-text-v1"
+FOUNDATION_MODEL_ARN = f"arn:aws:bedrock:{region}::foundation-model/{foundation_model}"
+
+# Prompt template for retrieve_and_generate; Bedrock substitutes the
+# retrieved chunks for $search_results$ and appends the user's question
+QUERY_PROMPT_TEMPLATE = """
+Human: You are a financial advisor AI system, and provides answers to questions by using fact based and statistical information when possible.
+Use the following pieces of information to provide a concise answer to the question.
+If you don't know the answer, just say that you don't know, don't try to make up an answer.
+<context>
+$search_results$
+</context>
+
+The response should be specific and use statistics or numbers when possible.
+
+Assistant:"""
+
+# Static halves of the retrieve_and_generate configuration; only the
+# knowledge base id is filled in per request
+QUERY_RETRIEVAL_CONFIG = {
+    'vectorSearchConfiguration': {
+        'numberOfResults': 5,
+        'overrideSearchType': "HYBRID", # optional
+    }
+}
+QUERY_GENERATION_CONFIG = {
+    'promptTemplate': {
+        'textPromptTemplate': QUERY_PROMPT_TEMPLATE
+    }
+}
+
+@functools.lru_cache(maxsize=1)
+def get_data_bucket_name():
+    return f'bedrock-kb-data-{suffix}-{get_account_id()}'
+
 # Knowledge Base setup
 class BedrockKnowledgeBase:
     def __init__(self, kb_name, kb_description, data_sources, chunking_strategy="FIXED_SIZE", suffix=""):
@@ -53,6 +126,18 @@ class BedrockKnowledgeBase:
         self._setup_knowledge_base()
         
     def _setup_knowledge_base(self):
+        # Reuse an existing KB with this name so restarts don't create
+        # duplicate buckets, roles and knowledge bases
+        try:
+            existing = bedrock_agent_client.list_knowledge_bases()
+            for kb in existing.get('knowledgeBaseSummaries', []):
+                if kb['name'] == self.kb_name:
+                    self.kb_id = kb['knowledgeBaseId']
+                    logger.info(f"Reusing existing Knowledge Base with ID: {self.kb_id}")
+                    return self.kb_id
+        except Exception as e:
+            logger.error(f"Error listing knowledge bases: {e}")
+
         # Create S3 buckets
         for source in self.data_sources:
             if source["type"] == "S3":
@@ -71,7 +156,7 @@ class BedrockKnowledgeBase:
                 knowledgeBaseConfiguration={
                     'type': 'VECTOR',
                     'vectorKnowledgeBaseConfiguration': {
-                        'embeddingModelArn': f"arn:aws:bedrock:{region}::foundation-model/amazon.titan-embed-text-v1"
+                        'embeddingModelArn': TITAN_EMBED_MODEL_ARN
                     }
                 }
             )
@@ -104,14 +189,22 @@ class BedrockKnowledgeBase:
             ]
         }
         
-        iam_client = boto3.client('iam')
+        # Reuse the role if an earlier run already created it
+        try:
+            existing_role = iam_client.get_role(RoleName=role_name)
+            return existing_role['Role']['Arn']
+        except iam_client.exceptions.NoSuchEntityException:
+            pass
+
         try:
             response = iam_client.create_role(
                 RoleName=role_name,
                 AssumeRolePolicyDocument=json.dumps(trust_policy)
             )
             
-            # Attach necessary policies
+            # Write the policy inline on the role: one IAM call instead of
+            # create_policy + attach_role_policy, and no managed policy left
+            # behind on every run
             policy_document = {
                 "Version": "2012-10-17",
                 "Statement": [
@@ -119,24 +212,20 @@ class BedrockKnowledgeBase:
                         "Effect": "Allow",
                         "Action": ["s3:GetObject", "s3:ListBucket"],
                         "Resource": [
-                            f"arn:aws:s3:::{data_bucket_name}",
-                            f"arn:aws:s3:::{data_bucket_name}/*"
+                            f"arn:aws:s3:::{get_data_bucket_name()}",
+                            f"arn:aws:s3:::{get_data_bucket_name()}/*"
                         ]
                     }
                 ]
             }
-            
+
             policy_name = f"BedrockKBPolicy-{self.suffix}"
-            policy_response = iam_client.create_policy(
+            iam_client.put_role_policy(
+                RoleName=role_name,
                 PolicyName=policy_name,
                 PolicyDocument=json.dumps(policy_document)
             )
-            
-            iam_client.attach_role_policy(
-                RoleName=role_name,
-                PolicyArn=policy_response['Policy']['Arn']
-            )
-            
+
             return response['Role']['Arn']
             
         except Exception as e:
@@ -203,12 +292,15 @@ class BedrockKnowledgeBase:
                 if delete_s3_bucket:
                     for source in self.data_sources:
                         if source["type"] == "S3":
-                            # Delete all objects in the bucket
-                            objects = s3_client.list_objects_v2(Bucket=source["bucket_name"])
-                            if 'Contents' in objects:
-                                delete_keys = {'Objects': [{'Key': obj['Key']} for obj in objects['Contents']]}
-                                s3_client.delete_objects(Bucket=source["bucket_name"], Delete=delete_keys)
-                            
+                            # Delete all objects in the bucket, one page
+                            # (up to 1000 keys) at a time so buckets larger
+                            # than a single listing are fully emptied
+                            paginator = s3_client.get_paginator('list_objects_v2')
+                            for page in paginator.paginate(Bucket=source["bucket_name"]):
+                                if 'Contents' in page:
+                                    delete_keys = {'Objects': [{'Key': obj['Key']} for obj in page['Contents']]}
+                                    s3_client.delete_objects(Bucket=source["bucket_name"], Delete=delete_keys)
+
                             # Delete the bucket
                             s3_client.delete_bucket(Bucket=source["bucket_name"])
                             logger.info(f"Deleted S3 bucket: {source['bucket_name']}")
@@ -217,31 +309,126 @@ class BedrockKnowledgeBase:
             logger.error(f"Error deleting resources: {e}")
             raise
 
-# Initialize KB
-def initialize_kb():
-    global kb_instance
-    
-    # Define data sources
-    data_sources = [
-        {"type": "S3", "bucket_name": data_bucket_name}
-    ]
-    
-    # Create knowledge base
-    kb_instance = BedrockKnowledgeBase(
-        kb_name=knowledge_base_name,
-        kb_description="Knowledge base for PDF documents",
-        data_sources=data_sources,
-        chunking_strategy="FIXED_SIZE", 
-        suffix=suffix
-    )
-    
-    return kb_instance.get_knowledge_base_id()
+# Lazy KB initialization. The instance is created on first use behind a
+# double-checked lock, so importing the module stays free of AWS calls and
+# concurrent first requests don't race to create duplicate resources.
+_kb_lock = threading.Lock()
+_kb_instance = None
+
+def get_kb():
+    global _kb_instance
+    if _kb_instance is not None:
+        return _kb_instance
+    with _kb_lock:
+        if _kb_instance is None:
+            data_sources = [
+                {"type": "S3", "bucket_name": get_data_bucket_name()}
+            ]
+            _kb_instance = BedrockKnowledgeBase(
+                kb_name=knowledge_base_name,
+                kb_description="Knowledge base for PDF documents",
+                data_sources=data_sources,
+                chunking_strategy="FIXED_SIZE",
+                suffix=suffix
+            )
+        return _kb_instance
+
+# Ingestion jobs scan the whole bucket, so a burst of uploads only needs one.
+# Each upload resets a short timer; the job starts once the burst settles.
+INGESTION_DEBOUNCE_SECONDS = 10
+_ingestion_lock = threading.Lock()
+_ingestion_timer = None
+
+def _run_ingestion_job():
+    global _ingestion_timer
+    with _ingestion_lock:
+        _ingestion_timer = None
+    # Peek rather than get_kb(): a timer firing after /cleanup must not
+    # re-provision the stack just to ingest into it
+    kb = _kb_instance
+    if kb is None:
+        return
+    try:
+        kb.start_ingestion_job()
+    except Exception as e:
+        logger.error(f"Error starting debounced ingestion job: {e}")
+
+def cancel_pending_ingestion_job():
+    global _ingestion_timer
+    with _ingestion_lock:
+        if _ingestion_timer is not None:
+            _ingestion_timer.cancel()
+            _ingestion_timer = None
+
+def schedule_ingestion_job():
+    global _ingestion_timer
+    with _ingestion_lock:
+        if _ingestion_timer is not None:
+            _ingestion_timer.cancel()
+        _ingestion_timer = threading.Timer(INGESTION_DEBOUNCE_SECONDS, _run_ingestion_job)
+        _ingestion_timer.daemon = True
+        _ingestion_timer.start()
+
+# Uploads run on a small worker pool so the POST handler can return as soon
+# as the file is validated; job state lives in memory keyed by token and is
+# reported through /status. Finished entries are pruned after a grace period
+# so the dict doesn't grow for the life of the process.
+UPLOAD_JOB_TTL_SECONDS = 300
+upload_executor = ThreadPoolExecutor(max_workers=4)
+upload_jobs = {}
+
+def _prune_upload_jobs():
+    cutoff = time.time() - UPLOAD_JOB_TTL_SECONDS
+    for token, job in list(upload_jobs.items()):
+        if job.get('status') in ('completed', 'failed') and job.get('finished_at', 0) < cutoff:
+            upload_jobs.pop(token, None)
+
+def _do_upload(data, filename, job_token):
+    upload_jobs[job_token]['status'] = 'uploading'
+    try:
+        s3_client.upload_fileobj(
+            io.BytesIO(data),
+            get_data_bucket_name(),
+            filename,
+            Config=s3_transfer_config
+        )
+        schedule_ingestion_job()
+        upload_jobs[job_token]['status'] = 'completed'
+    except Exception as e:
+        logger.error(f"Error uploading file {filename}: {e}")
+        upload_jobs[job_token]['status'] = 'failed'
+        upload_jobs[job_token]['error'] = str(e)
+    upload_jobs[job_token]['finished_at'] = time.time()
+
+# File-like wrapper that replays peeked bytes ahead of the remaining stream,
+# for validating magic bytes on non-seekable request bodies
+class PeekedStream:
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size=-1):
+        if not self._head:
+            return self._stream.read(size)
+        if size is None or size < 0:
+            head, self._head = self._head, b''
+            return head + self._stream.read()
+        head, self._head = self._head[:size], self._head[size:]
+        if len(head) < size:
+            head += self._stream.read(size - len(head))
+        return head
 
 # Check if file extension is allowed
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+# When Werkzeug enforces max_content_length mid-parse it raises a 413;
+# answer with JSON like every other error path on the upload endpoints
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    return jsonify({'error': 'File too large for form upload; use PUT /upload_raw/<filename>'}), 413
+
 # Routes
 @app.route('/')
 def index():
@@ -250,6 +437,13 @@ def index():
 @app.route('/upload', methods=['GET', 'POST'])
 def upload_file():
     if request.method == 'POST':
+        # Werkzeug enforces this limit while reading the body, so chunked
+        # requests without a Content-Length header are capped too; the
+        # header check below just fails oversized uploads before parsing
+        request.max_content_length = MAX_FORM_UPLOAD_BYTES
+        if request.content_length and request.content_length > MAX_FORM_UPLOAD_BYTES:
+            return jsonify({'error': 'File too large for form upload; use PUT /upload_raw/<filename>'}), 413
+
         # Check if the post request has the file part
         if 'file' not in request.files:
             return jsonify({'error': 'No file part'}), 400
@@ -262,36 +456,68 @@ def upload_file():
             return jsonify({'error': 'No selected file'}), 400
         
         if file and allowed_file(file.filename):
+            # Peek at the magic bytes so non-PDFs are rejected before we
+            # spend any bandwidth on them, whatever their extension claims
+            head = file.stream.read(5)
+            file.stream.seek(0)
+            if head != b'%PDF-':
+                return jsonify({'error': 'File is not a valid PDF'}), 415
+
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            try:
-                # Upload to S3
-                s3_client.upload_file(file_path, data_bucket_name, filename)
-                
-                # Start ingestion
-                ingestion_job_id = kb_instance.start_ingestion_job()
-                
-                return jsonify({
-                    'message': 'File uploaded successfully',
-                    'filename': filename,
-                    'ingestion_job_id': ingestion_job_id
-                })
-                
-            except Exception as e:
-                logger.error(f"Error uploading file: {e}")
-                return jsonify({'error': str(e)}), 500
-            
-            finally:
-                # Clean up local file
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-        
+
+            # Hand the S3 transfer and ingestion scheduling to the worker
+            # pool and acknowledge immediately; clients track progress
+            # through /status
+            data = file.stream.read()
+            job_token = str(uuid.uuid4())
+            _prune_upload_jobs()
+            upload_jobs[job_token] = {'filename': filename, 'status': 'queued'}
+            upload_executor.submit(_do_upload, data, filename, job_token)
+
+            return jsonify({
+                'message': 'File accepted, upload and ingestion queued',
+                'filename': filename,
+                'job_token': job_token
+            }), 202
+
         return jsonify({'error': 'Invalid file type'}), 400
-    
+
     return render_template('upload.html')
 
+@app.route('/upload_raw/<path:filename>', methods=['PUT'])
+def upload_raw(filename):
+    # Stream the raw request body straight into S3's multipart uploader in
+    # 8MB parts: constant memory use and no size cap, for PDFs too large
+    # for the form endpoint. Usage: curl -T file.pdf http://host/upload_raw/file.pdf
+    filename = secure_filename(filename)
+
+    if not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+
+    # Same magic-byte check as the form endpoint; the peeked bytes are
+    # replayed ahead of the rest of the (non-seekable) body
+    head = request.stream.read(5)
+    if head != b'%PDF-':
+        return jsonify({'error': 'File is not a valid PDF'}), 415
+
+    try:
+        s3_client.upload_fileobj(
+            PeekedStream(head, request.stream),
+            get_data_bucket_name(),
+            filename,
+            Config=s3_transfer_config
+        )
+        schedule_ingestion_job()
+
+        return jsonify({
+            'message': 'File uploaded successfully, ingestion scheduled',
+            'filename': filename
+        })
+
+    except Exception as e:
+        logger.error(f"Error uploading file {filename}: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/query', methods=['GET', 'POST'])
 def query_kb():
     if request.method == 'POST':
@@ -302,394 +528,192 @@ def query_kb():
         
         try:
             # Get KB ID
-            kb_id = kb_instance.get_knowledge_base_id()
-            
-            # Query the KB
-            response = bedrock_agent_runtime_client.retrieve(
-                    retrievalQuery= {
-                        'text': query
-                    },
-                    knowledgeBaseId=kb_id,
-                    retrievalConfiguration= {
-                        'vectorSearchConfiguration': {
-                            'numberOfResults': 5,
-                            'overrideSearchType': "HYBRID", # optional
-                        }
+            kb_id = get_kb().get_knowledge_base_id()
+
+            # Retrieval and generation fused into one server-side call:
+            # Bedrock pipelines both stages itself and streams the output
+            # back, instead of the app making two HTTPS round-trips
+            response = bedrock_agent_runtime_client.retrieve_and_generate_stream(
+                input={'text': query},
+                retrieveAndGenerateConfiguration={
+                    'type': 'KNOWLEDGE_BASE',
+                    'knowledgeBaseConfiguration': {
+                        'knowledgeBaseId': kb_id,
+                        'modelArn': FOUNDATION_MODEL_ARN,
+                        'retrievalConfiguration': QUERY_RETRIEVAL_CONFIG,
+                        'generationConfiguration': QUERY_GENERATION_CONFIG
                     }
-                )
-            
-            
-            retrievalResults = response['retrievalResults']
-            contexts = []
-            for retrievedResult in retrievalResults: 
-                contexts.append(retrievedResult['content']['text'])
-            
-            prompt = f"""
-            Human: You are a financial advisor AI system, and provides answers to questions by using fact based and statistical information when possible. 
-            Use the following pieces of information to provide a concise answer to the question enclosed in <question> tags. 
-            If you don't know the answer, just say that you don't know, don't try to make up an answer.
-            <context>
-            {contexts}
-            </context>
-
-            <question>
-            {query}
-            </question>
-
-            The response should be specific and use statistics or numbers when possible.
-
-            Assistant:"""
-            messages=[{ "role":'user', "content":[{'type':'text','text': prompt.format(contexts, query)}]}]
-            sonnet_payload = json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 512,
-                "messages": messages,
-                "temperature": 0.5,
-                "top_p": 1
-                    }  )
-            modelId = 'anthropic.claude-3-sonnet-20240229-v1:0' # change this to use a different version from the model provider
-            accept = 'application/json'
-            contentType = 'application/json'
-            response = bedrock_agent_runtime_client.invoke_model(body=sonnet_payload, modelId=modelId, accept=accept, contentType=contentType)
-            response_body = json.loads(response.get('body').read())
-            response_text = response_body.get('content')[0]['text']
-            return response_text
-            
+                }
+            )
+
+            # Relay output text as SSE events while the model is still
+            # generating; citation events carry the retrieved chunks
+            def generate(stream=response['stream']):
+                try:
+                    for event in stream:
+                        if 'output' in event:
+                            text = event['output'].get('text', '')
+                            if text:
+                                yield f"data: {orjson.dumps({'delta': text}).decode()}\n\n"
+                        elif 'citation' in event:
+                            # Prefer the top-level retrievedReferences; the
+                            # nested citation member is deprecated in the
+                            # bedrock-agent-runtime model
+                            citation = event['citation']
+                            refs = (citation.get('retrievedReferences')
+                                    or citation.get('citation', {}).get('retrievedReferences', []))
+                            retrieved_chunks = [{
+                                'text': ref.get('content', {}).get('text'),
+                                'location': ref.get('location', {}).get('s3Location', {}).get('uri')
+                            } for ref in refs]
+                            if retrieved_chunks:
+                                yield f"data: {orjson.dumps({'retrieved_chunks': retrieved_chunks}).decode()}\n\n"
+                except Exception as e:
+                    logger.error(f"Error streaming model response: {e}")
+                    yield f"data: {orjson.dumps({'error': str(e)}).decode()}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
         except Exception as e:
             logger.error(f"Error querying knowledge base: {e}")
             return jsonify({'error': str(e)}), 500
     
     return render_template('query.html')
 
+def _collect_status():
+    _prune_upload_jobs()
+
+    # Read-only: peek at the instance rather than calling get_kb(), so a
+    # status check (the index page fires one on every load) can never
+    # provision the stack — in particular not right after /cleanup
+    kb = _kb_instance
+    if kb is None:
+        return {
+            'kb_id': None,
+            'kb_status': 'NOT_INITIALIZED',
+            'ingestion_jobs': [],
+            'uploads': {token: dict(job) for token, job in upload_jobs.items()}
+        }
+
+    kb_id = kb.get_knowledge_base_id()
+    kb_status = bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)
+
+    # Get ingestion jobs
+    ingestion_jobs = bedrock_agent_client.list_ingestion_jobs(knowledgeBaseId=kb_id)
+
+    return {
+        'kb_id': kb_id,
+        'kb_status': kb_status['knowledgeBase']['status'],
+        'ingestion_jobs': [{
+            'id': job['ingestionJobId'],
+            'status': job['status']
+        } for job in ingestion_jobs.get('ingestionJobSummaries', [])],
+        # Copy the job entries: the live dict is mutated by the upload
+        # workers while snapshots are serialized and held by long-polls
+        'uploads': {token: dict(job) for token, job in upload_jobs.items()}
+    }
+
+# Long-poll support: one background thread refreshes the status snapshot and
+# wakes any held /status/long requests when the change token moves, so open
+# browser tabs get push-style updates without each busy-polling Bedrock
+STATUS_POLL_INTERVAL_SECONDS = 2
+LONG_POLL_TIMEOUT_SECONDS = 25
+_status_condition = threading.Condition()
+_status_snapshot = None
+_status_token = None
+_status_poller_started = False
+
+def _status_poller():
+    global _status_snapshot, _status_token
+    while True:
+        try:
+            # _collect_status is read-only, so polling while no KB exists
+            # just publishes the NOT_INITIALIZED snapshot to waiters
+            snapshot = _collect_status()
+            token = hashlib.sha1(json.dumps(snapshot, sort_keys=True).encode()).hexdigest()
+            with _status_condition:
+                if token != _status_token:
+                    _status_snapshot = snapshot
+                    _status_token = token
+                    _status_condition.notify_all()
+        except Exception as e:
+            logger.error(f"Error polling status: {e}")
+        time.sleep(STATUS_POLL_INTERVAL_SECONDS)
+
+def _ensure_status_poller():
+    global _status_poller_started
+    if _status_poller_started:
+        return
+    with _status_condition:
+        if not _status_poller_started:
+            threading.Thread(target=_status_poller, daemon=True).start()
+            _status_poller_started = True
+
+# Only cache successful /status responses; a transient Bedrock error must
+# not be served to every client for the whole cache window
+def _status_cacheable(response):
+    return not (isinstance(response, tuple) and response[1] >= 400)
+
 @app.route('/status')
+@cache.cached(timeout=5, response_filter=_status_cacheable)
 def status():
     try:
-        kb_id = kb_instance.get_knowledge_base_id()
-        kb_status = bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)
-        
-        # Get ingestion jobs
-        ingestion_jobs = bedrock_agent_client.list_ingestion_jobs(knowledgeBaseId=kb_id)
-        
-        return jsonify({
-            'kb_id': kb_id,
-            'kb_status': kb_status['knowledgeBase']['status'],
-            'ingestion_jobs': [{
-                'id': job['ingestionJobId'],
-                'status': job['status']
-            } for job in ingestion_jobs.get('ingestionJobSummaries', [])]
-        })
-        
+        return jsonify(_collect_status())
+
+    except Exception as e:
+        logger.error(f"Error getting status: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/status/long')
+def status_long():
+    # Hold the request open until the status changes from the client's last
+    # seen token (or the timeout lapses), then return the fresh snapshot
+    since = request.args.get('since', '')
+    _ensure_status_poller()
+    try:
+        with _status_condition:
+            if _status_snapshot is None or _status_token == since:
+                _status_condition.wait(timeout=LONG_POLL_TIMEOUT_SECONDS)
+            if _status_snapshot is None:
+                return jsonify({'error': 'Status not available yet'}), 503
+            return jsonify(dict(_status_snapshot, token=_status_token))
+
     except Exception as e:
         logger.error(f"Error getting status: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/cleanup')
 def cleanup():
+    global _kb_instance
     try:
-        kb_instance.delete_kb(delete_s3_bucket=True)
+        # Nothing to tear down if the KB was never created; don't let
+        # get_kb() provision the stack just to delete it
+        kb = _kb_instance
+        if kb is None:
+            return jsonify({'message': 'No resources to clean up'})
+
+        cancel_pending_ingestion_job()
+        kb.delete_kb(delete_s3_bucket=True)
+        with _kb_lock:
+            _kb_instance = None
         return jsonify({'message': 'Resources cleaned up successfully'})
     except Exception as e:
         logger.error(f"Error cleaning up: {e}")
         return jsonify({'error': str(e)}), 500
 
-# HTML Templates
-@app.route('/templates/index.html')
-def get_index_template():
-    return """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>AWS Bedrock Knowledge Base</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body>
-        <div class="container mt-5">
-            <h1>AWS Bedrock Knowledge Base Demo</h1>
-            <div class="row mt-4">
-                <div class="col-md-6">
-                    <div class="card">
-                        <div class="card-body">
-                            <h5 class="card-title">Upload PDF</h5>
-                            <p class="card-text">Upload PDF documents to the knowledge base.</p>
-                            <a href="/upload" class="btn btn-primary">Go to Upload</a>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-md-6">
-                    <div class="card">
-                        <div class="card-body">
-                            <h5 class="card-title">Query Knowledge Base</h5>
-                            <p class="card-text">Ask questions about uploaded documents.</p>
-                            <a href="/query" class="btn btn-primary">Go to Query</a>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            <div class="row mt-4">
-                <div class="col-md-12">
-                    <div class="card">
-                        <div class="card-body">
-                            <h5 class="card-title">Knowledge Base Status</h5>
-                            <div id="status-container">Loading...</div>
-                            <button id="refresh-btn" class="btn btn-secondary mt-3">Refresh Status</button>
-                            <a href="/cleanup" class="btn btn-danger mt-3 float-end" onclick="return confirm('Are you sure you want to delete all resources?');">Cleanup Resources</a>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-
-        <script>
-        function refreshStatus() {
-            fetch('/status')
-                .then(response => response.json())
-                .then(data => {
-                    if (data.error) {
-                        document.getElementById('status-container').innerHTML = `<div class="alert alert-danger">${data.error}</div>`;
-                    } else {
-                        let html = `<p><strong>KB ID:</strong> ${data.kb_id}</p>`;
-                        html += `<p><strong>Status:</strong> ${data.kb_status}</p>`;
-                        html += '<h6>Ingestion Jobs:</h6>';
-                        html += '<ul>';
-                        data.ingestion_jobs.forEach(job => {
-                            html += `<li>Job ${job.id}: ${job.status}</li>`;
-                        });
-                        html += '</ul>';
-                        document.getElementById('status-container').innerHTML = html;
-                    }
-                })
-                .catch(error => {
-                    document.getElementById('status-container').innerHTML = `<div class="alert alert-danger">Error fetching status: ${error}</div>`;
-                });
-        }
-
-        document.addEventListener('DOMContentLoaded', function() {
-            refreshStatus();
-            document.getElementById('refresh-btn').addEventListener('click', refreshStatus);
-        });
-        </script>
-    </body>
-    </html>
-    """
-
-@app.route('/templates/upload.html')
-def get_upload_template():
-    return """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Upload PDF</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body>
-        <div class="container mt-5">
-            <h1>Upload PDF to Knowledge Base</h1>
-            <div class="card mt-4">
-                <div class="card-body">
-                    <form id="upload-form" enctype="multipart/form-data">
-                        <div class="mb-3">
-                            <label for="file" class="form-label">Select PDF File</label>
-                            <input type="file" class="form-control" id="file" name="file" accept=".pdf" required>
-                        </div>
-                        <button type="submit" class="btn btn-primary">Upload</button>
-                        <a href="/" class="btn btn-secondary">Back to Home</a>
-                    </form>
-                    <div id="result-container" class="mt-3"></div>
-                    <div id="progress-container" class="mt-3 d-none">
-                        <div class="progress">
-                            <div id="progress-bar" class="progress-bar progress-bar-striped progress-bar-animated" role="progressbar" style="width: 0%"></div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-
-        <script>
-        document.addEventListener('DOMContentLoaded', function() {
-            const form = document.getElementById('upload-form');
-            const resultContainer = document.getElementById('result-container');
-            const progressContainer = document.getElementById('progress-container');
-            const progressBar = document.getElementById('progress-bar');
-            
-            form.addEventListener('submit', function(event) {
-                event.preventDefault();
-                
-                const formData = new FormData(form);
-                resultContainer.innerHTML = '';
-                progressContainer.classList.remove('d-none');
-                progressBar.style.width = '0%';
-                
-                // Simulate progress
-                let progress = 0;
-                const progressInterval = setInterval(() => {
-                    progress += 5;
-                    if (progress <= 90) {
-                        progressBar.style.width = progress + '%';
-                    }
-                }, 300);
-                
-                fetch('/upload', {
-                    method: 'POST',
-                    body: formData
-                })
-                .then(response => response.json())
-                .then(data => {
-                    clearInterval(progressInterval);
-                    progressBar.style.width = '100%';
-                    
-                    setTimeout(() => {
-                        progressContainer.classList.add('d-none');
-                        
-                        if (data.error) {
-                            resultContainer.innerHTML = `<div class="alert alert-danger">${data.error}</div>`;
-                        } else {
-                            resultContainer.innerHTML = `
-                                <div class="alert alert-success">
-                                    File "${data.filename}" uploaded successfully!<br>
-                                    Ingestion job started with ID: ${data.ingestion_job_id}<br>
-                                    <small>It may take a few minutes for the file to be processed.</small>
-                                </div>
-                            `;
-                            form.reset();
-                        }
-                    }, 500);
-                })
-                .catch(error => {
-                    clearInterval(progressInterval);
-                    progressContainer.classList.add('d-none');
-                    resultContainer.innerHTML = `<div class="alert alert-danger">Error: ${error}</div>`;
-                });
-            });
-        });
-        </script>
-    </body>
-    </html>
-    """
-
-@app.route('/templates/query.html')
-def get_query_template():
-    return """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Query Knowledge Base</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body>
-        <div class="container mt-5">
-            <h1>Query Knowledge Base</h1>
-            <div class="card mt-4">
-                <div class="card-body">
-                    <form id="query-form">
-                        <div class="mb-3">
-                            <label for="query" class="form-label">Enter your question</label>
-                            <textarea class="form-control" id="query" name="query" rows="3" required></textarea>
-                        </div>
-                        <button type="submit" class="btn btn-primary">Submit Query</button>
-                        <a href="/" class="btn btn-secondary">Back to Home</a>
-                    </form>
-                    <div id="loading" class="mt-3 d-none">
-                        <div class="d-flex align-items-center">
-                            <div class="spinner-border text-primary me-2" role="status">
-                                <span class="visually-hidden">Loading...</span>
-                            </div>
-                            <span>Processing query...</span>
-                        </div>
-                    </div>
-                    <div id="result-container" class="mt-3">
-                        <div id="answer-box" class="d-none">
-                            <h4>Answer:</h4>
-                            <div id="answer" class="p-3 bg-light rounded"></div>
-                        </div>
-                        <div id="sources-box" class="mt-4 d-none">
-                            <h4>Sources:</h4>
-                            <div id="sources"></div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-
-        <script>
-        document.addEventListener('DOMContentLoaded', function() {
-            const form = document.getElementById('query-form');
-            const loading = document.getElementById('loading');
-            const answerBox = document.getElementById('answer-box');
-            const answer = document.getElementById('answer');
-            const sourcesBox = document.getElementById('sources-box');
-            const sources = document.getElementById('sources');
-            
-            form.addEventListener('submit', function(event) {
-                event.preventDefault();
-                
-                const formData = new FormData(form);
-                
-                // Show loading
-                loading.classList.remove('d-none');
-                answerBox.classList.add('d-none');
-                sourcesBox.classList.add('d-none');
-                
-                fetch('/query', {
-                    method: 'POST',
-                    body: formData
-                })
-                .then(response => response.json())
-                .then(data => {
-                    loading.classList.add('d-none');
-                    
-                    if (data.error) {
-                        answer.innerHTML = `<div class="alert alert-danger">${data.error}</div>`;
-                        answerBox.classList.remove('d-none');
-                    } else {
-                        // Display answer
-                        answer.innerHTML = data.answer.replace(/\\n/g, '<br>');
-                        answerBox.classList.remove('d-none');
-                        
-                        // Display retrieved chunks if available
-                        if (data.retrieved_chunks && data.retrieved_chunks.length > 0) {
-                            let sourcesHtml = '';
-                            data.retrieved_chunks.forEach((chunk, index) => {
-                                sourcesHtml += `
-                                    <div class="card mb-3">
-                                        <div class="card-header">Source ${index + 1}</div>
-                                        <div class="card-body">
-                                            <p>${chunk.text}</p>
-                                            <small class="text-muted">Location: ${chunk.location || 'N/A'}</small>
-                                        </div>
-                                    </div>
-                                `;
-                            });
-                            sources.innerHTML = sourcesHtml;
-                            sourcesBox.classList.remove('d-none');
-                        }
-                    }
-                })
-                .catch(error => {
-                    loading.classList.add('d-none');
-                    answer.innerHTML = `<div class="alert alert-danger">Error: ${error}</div>`;
-                    answerBox.classList.remove('d-none');
-                });
-            });
-        });
-        </script>
-    </body>
-    </html>
-    """
-
-# Helper function to render templates
-def render_template(template_name):
-    if template_name == 'index.html':
-        return get_index_template()
-    elif template_name == 'upload.html':
-        return get_upload_template()
-    elif template_name == 'query.html':
-        return get_query_template()
-
 if __name__ == '__main__':
     # Initialize the knowledge base
-    kb_id = initialize_kb()
+    kb_id = get_kb().get_knowledge_base_id()
     print(f"Knowledge Base initialized with ID: {kb_id}")
     
-    # Run the Flask app
-    app.run(debug=True, port=5000)
+    # Run the Flask app. The dev server already runs a thread per request
+    # (threaded=True is the default), which lets the long Bedrock/S3 waits
+    # overlap across users; production concurrency comes from the threaded
+    # gunicorn workers in gunicorn.conf.py. The debugger/reloader is opt-in.
+    app.run(
+        debug=os.environ.get('FLASK_DEBUG') == '1',
+        host='0.0.0.0',
+        port=int(os.environ.get('PORT', 5000))
+    )
 
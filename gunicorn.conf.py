@@ -0,0 +1,14 @@
+# Gunicorn settings for production: run with `gunicorn app:app`.
+# The handlers are I/O-bound on Bedrock/S3, so threaded workers let many
+# in-flight requests share each process.
+import multiprocessing
+
+bind = "0.0.0.0:5000"
+workers = 2 * multiprocessing.cpu_count() + 1
+# Import the app once in the master so the KB_SUFFIX default seeded at import
+# is inherited by every worker; without this each worker would generate its
+# own suffix and create its own KB. Safe because import makes no AWS calls.
+preload_app = True
+worker_class = "gthread"
+threads = 8
+keepalive = 30